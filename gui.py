@@ -1,106 +1,110 @@
 import tkinter as tk
-import random
-import pickle
+import atexit
+import numpy as np
+
+from ttt_core import (X, O, DRAW, SYMS, STATE_POWERS, LEGAL_MOVES_TABLE, check_winner_bb,
+                      get_state, empty_qtable, load_qtable, save_qtable, q_size)
 
 # ---------- Q-learning parameters ----------
 alpha = 0.5    # learning rate
 gamma = 0.9    # discount factor
 
+SAVE_EVERY = 10  # write the Q-table to disk every N finished games
+
 # ---------- Load or init Q-table ----------
 try:
-    with open("qtable.pkl", "rb") as f:
-        Q = pickle.load(f)
-    print(f"✓ Loaded Q-table with {len(Q)} states")
+    Q = load_qtable()
+    print(f"✓ Loaded Q-table with {q_size(Q)} states")
 except FileNotFoundError:
-    Q = {}
+    Q = empty_qtable()
     print("⚠️ No Q-table found, starting fresh.")
 
-def convert_to_training_format(board):
-    """Convert GUI board format to training format"""
-    mapping = {0: " ", 1: "X", -1: "O"}
-    return [mapping[cell] for cell in board]
-
-def get_state(board):
-    return "".join(convert_to_training_format(board))
-
 epsilon = 0.2  # 20% chance to explore instead of exploit
+rng = np.random.default_rng()  # same PCG64 generator train.py and test.py use
 
-def best_ai_move(board):
-    available_moves = [i for i in range(9) if board[i] == 0]
+def best_ai_move(occ, state, sym):
+    available_moves = LEGAL_MOVES_TABLE[occ]
     if not available_moves:
         return None
     
-    state = get_state(board)
-    if state not in Q:
-        Q[state] = {}
-    
     # 🔥 With probability ε, pick a random move (explore)
-    if random.random() < epsilon:
-        return random.choice(available_moves)
+    if rng.random() < epsilon:
+        return available_moves[rng.integers(len(available_moves))]
     
     # Otherwise exploit best known move
-    q_values = [(move, Q[state].get(move, 0.0)) for move in available_moves]
-    max_q = max(q_values, key=lambda x: x[1])[1]
-    best_moves = [m for m, q in q_values if q == max_q]
-    
-    return random.choice(best_moves)
-
-def update_q(prev_state, action, reward, next_state):
-    """Update Q-table with Q-learning formula"""
-    if prev_state not in Q:
-        Q[prev_state] = {}
-    if action not in Q[prev_state]:
-        Q[prev_state][action] = 0.0
-    if next_state not in Q:
-        Q[next_state] = {}
+    q_values = Q[state, SYMS[sym, available_moves]]
+    best_moves = np.flatnonzero(q_values == q_values.max())
     
-    old_q = Q[prev_state][action]
-    future_q = max(Q[next_state].values(), default=0.0)
-    Q[prev_state][action] = old_q + alpha * (reward + gamma * future_q - old_q)
+    return available_moves[best_moves[rng.integers(len(best_moves))]]
+
+games_since_save = 0
+
+def flush_qtable():
+    """Write the Q-table if any game has finished since the last save"""
+    global games_since_save
+    if games_since_save:
+        save_qtable(Q)
+        games_since_save = 0
+
+atexit.register(flush_qtable)  # never lose the last few games
+
+def update_q(states, actions, reward):
+    """
+    Q-learning update for a whole game in one numpy pass: move t looks
+    ahead to the best legal move from the state of move t+1; the last
+    move ends the game, so it gets the reward and no look-ahead.
+    """
+    next_states = states[1:]
+    # A row's state id is its canonical board in ternary; empty cells (0) are its legal columns
+    legal = next_states[:, None] // STATE_POWERS % 3 == 0
+    future_q = np.append(np.where(legal, Q[next_states], -np.inf).max(axis=1), 0.0)
+    rewards = np.zeros(len(states))
+    rewards[-1] = reward
+    Q[states, actions] += alpha * (rewards + gamma * future_q - Q[states, actions])
 
 # ---------- Game logic ----------
-board = [0] * 9
+x_bb, o_bb = 0, 0  # AI (X) and human (O) bitboards
+occ = 0            # x_bb | o_bb, kept up to date move by move
 buttons = []
 game_over = False
-ai_memory = []  # store (state, action) for this game
-
-def check_winner(board):
-    win_patterns = [
-        (0,1,2),(3,4,5),(6,7,8),
-        (0,3,6),(1,4,7),(2,5,8),
-        (0,4,8),(2,4,6)
-    ]
-    for a,b,c in win_patterns:
-        if board[a] == board[b] == board[c] != 0:
-            return board[a]
-    if 0 not in board:
-        return 0
-    return None
+# This game's AI (X) states and the moves taken from them (canonical frame);
+# the human moves first, so the AI moves at most 4 times
+hist_states = np.empty(4, dtype=np.int64)
+hist_actions = np.empty(4, dtype=np.int64)
+hist_n = 0
+
+def check_winner(x_bb, o_bb):
+    # GUI convention: 1 = AI (X) wins, -1 = human (O) wins, 0 = draw
+    return {X: 1, O: -1, DRAW: 0}.get(check_winner_bb(x_bb, o_bb))
 
 def handle_click(i):
-    global game_over
+    global game_over, x_bb, o_bb, occ, hist_n
     
-    if board[i] != 0 or game_over:
+    if (occ >> i) & 1 or game_over:
         return
     
     # Human move
-    board[i] = -1
+    o_bb |= 1 << i
+    occ |= 1 << i
     buttons[i].config(text="O", bg="lightblue", state="disabled")
     
-    result = check_winner(board)
+    result = check_winner(x_bb, o_bb)
     if result is not None:
         end_game(result)
         return
     
     # AI move
-    state = get_state(board)
-    ai_move = best_ai_move(board)
+    state, sym = get_state(x_bb, o_bb, 0)  # the AI always plays X
+    ai_move = best_ai_move(occ, state, sym)
     if ai_move is not None:
-        ai_memory.append((state, ai_move))  # remember choice
-        board[ai_move] = 1
+        hist_states[hist_n] = state
+        hist_actions[hist_n] = SYMS[sym, ai_move]
+        hist_n += 1
+        x_bb |= 1 << ai_move
+        occ |= 1 << ai_move
         buttons[ai_move].config(text="X", bg="lightcoral", state="disabled")
         
-        result = check_winner(board)
+        result = check_winner(x_bb, o_bb)
         if result is not None:
             end_game(result)
             return
@@ -108,7 +112,7 @@ def handle_click(i):
     status.config(text="Your turn (O)!")
 
 def end_game(result):
-    global game_over
+    global game_over, games_since_save
     game_over = True
     
     # Assign rewards
@@ -123,34 +127,37 @@ def end_game(result):
         status.config(text="It's a draw! 🤝", fg="blue")
     
     # Train from memory
-    next_state = get_state(board)
-    for state, action in reversed(ai_memory):
-        update_q(state, action, reward, next_state)
-        next_state = state
-        reward = 0  # only final outcome gets nonzero reward
+    if hist_n:
+        update_q(hist_states[:hist_n], hist_actions[:hist_n], reward)
     
-    # Save Q-table
-    with open("qtable.pkl", "wb") as f:
-        pickle.dump(Q, f)
+    # Save Q-table every SAVE_EVERY games instead of blocking on every one
+    games_since_save += 1
+    if games_since_save >= SAVE_EVERY:
+        flush_qtable()
     
     # Disable all buttons
     for b in buttons:
         b.config(state="disabled")
 
 def reset_game():
-    global board, game_over, ai_memory
-    board = [0]*9
+    global x_bb, o_bb, occ, game_over, hist_n
+    x_bb, o_bb, occ = 0, 0, 0
     game_over = False
-    ai_memory = []
+    hist_n = 0
     for b in buttons:
         b.config(text=" ", bg="gray90", state="normal")
     status.config(text="Your turn (O)! Click any square.", fg="black")
 
+def on_close():
+    flush_qtable()
+    root.destroy()
+
 # ---------- GUI ----------
 root = tk.Tk()
 root.title("Tic Tac Toe vs Q-Learning AI")
 root.geometry("400x500")
 root.resizable(False, False)
+root.protocol("WM_DELETE_WINDOW", on_close)
 
 title_label = tk.Label(root, text="Tic Tac Toe", font=("Arial", 20, "bold"))
 title_label.pack(pady=10)
@@ -176,7 +183,7 @@ control_frame.pack(pady=10)
 tk.Button(control_frame, text="New Game", font=("Arial", 12),
           command=reset_game, bg="lightgreen", padx=20).pack(side=tk.LEFT, padx=10)
 tk.Button(control_frame, text="Quit", font=("Arial", 12),
-          command=root.quit, bg="lightcoral", padx=20).pack(side=tk.LEFT, padx=10)
+          command=on_close, bg="lightcoral", padx=20).pack(side=tk.LEFT, padx=10)
 
 info_label = tk.Label(root, text="AI learns with Q-Learning while you play",
                       font=("Arial", 10), fg="gray")
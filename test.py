@@ -1,91 +1,77 @@
-import random, pickle
-
-# -------- Tic-Tac-Toe Setup --------
-def initialize_board():
-    return [" "] * 9
-
-def check_winner(board):
-    win_patterns = [
-        [0,1,2],[3,4,5],[6,7,8],
-        [0,3,6],[1,4,7],[2,5,8],
-        [0,4,8],[2,4,6]
-    ]
-    for a,b,c in win_patterns:
-        if board[a] == board[b] == board[c] != " ":
-            return board[a]
-    return None
-
-def is_full(board):
-    return " " not in board
-
-def available_moves(board):
-    return [i for i, c in enumerate(board) if c == " "]
-
-# -------- Minimax for Smart Opponent --------
-def minimax(board, is_maximizing, depth=0):
-    winner = check_winner(board)
-    if winner == "O": return 1 - depth * 0.01
-    if winner == "X": return -1 + depth * 0.01
-    if is_full(board): return 0
-
-    if is_maximizing:
-        best = -999
-        for move in available_moves(board):
-            board[move] = "O"
-            score = minimax(board, False, depth + 1)
-            board[move] = " "
-            best = max(best, score)
-        return best
-    else:
-        best = 999
-        for move in available_moves(board):
-            board[move] = "X"
-            score = minimax(board, True, depth + 1)
-            board[move] = " "
-            best = min(best, score)
-        return best
-
-def optimal_move(board):
-    best_score = -999
-    best = None
-    for m in available_moves(board):
-        board[m] = "O"
-        score = minimax(board, False)
-        board[m] = " "
-        if score > best_score:
-            best_score = score
-            best = m
-    return best
+import numpy as np
+
+from ttt_core import (N_STATES, X, O, DRAW, SYMS, TERNARY, CANON, CANON_SYM,
+                      WINNER_LUT, CELL_BITS, OPTIMAL_POLICY, load_qtable, q_size)
 
 # -------- Load Q-table --------
 try:
-    with open("qtable.pkl", "rb") as f:
-        Q = pickle.load(f)
-    print(f"✓ Loaded Q-table with {len(Q)} states")
+    Q = load_qtable(mmap_mode="r")  # read-only here, no need to copy it in
+    print(f"✓ Loaded Q-table with {q_size(Q)} states")
 except FileNotFoundError:
-    print("Error: qtable.pkl not found. Please train the agent first.")
+    print("Error: qtable.npy not found. Please train the agent first.")
     raise SystemExit
 
-# --- Auto-detect whether Q-table is role-aware (board + 'X'/'O') ---
-def is_role_aware(qtable) -> bool:
-    try:
-        k = next(iter(qtable.keys()))
-    except StopIteration:
-        return True  # assume role-aware if empty
-    return len(k) == 10  # 9 board chars + 1 role
+# Q is only read here, so which states were ever trained is fixed for the whole run
+visited = Q.any(axis=1)
+
+# -------- Batched Rollouts --------
+rng = np.random.default_rng()
+
+def random_legal_moves(occ):
+    """One uniformly random free cell per board in `occ`"""
+    legal = (occ[:, None] & CELL_BITS) == 0
+    return np.where(legal, rng.random(legal.shape), -1.0).argmax(axis=1)
+
+# Opponents: one O move per board
+def random_moves(x_bb, o_bb):
+    return random_legal_moves(x_bb | o_bb)
 
-ROLE_AWARE = is_role_aware(Q)
+def optimal_moves(x_bb, o_bb):
+    # OPTIMAL_POLICY covers every reachable position with O to move
+    return OPTIMAL_POLICY[TERNARY[x_bb] + 2 * TERNARY[o_bb]]
 
-def get_state(board, role="X"):
-    s = "".join(board)
-    return s + role if ROLE_AWARE else s
+OPPONENTS = {"Random": random_moves, "Smart": optimal_moves}
+
+def test_batch(n_games: int, opponent_type: str):
+    """
+    Plays n_games in lock-step, all boards at once as bitboard arrays.
+    The agent (X) plays greedily, random in states it never visited;
+    the opponent (O) is minimax for "Smart", random otherwise.
+    Returns (wins, losses, draws).
+    """
+    opponent = OPPONENTS.get(opponent_type, random_moves)
+    x_bb = np.zeros(n_games, dtype=np.int64)
+    o_bb = np.zeros(n_games, dtype=np.int64)
+    wins = losses = draws = 0
 
-def choose_action(state, moves):
-    # Evaluation-only: greedy
-    if state not in Q:
-        return random.choice(moves)
-    # Use 0.0 for unseen actions in this state
-    return max(moves, key=lambda a: Q[state].get(a, 0.0))
+    while len(x_bb):
+        # Agent (X): greedy over legal moves, first best on ties
+        occ = x_bb | o_bb
+        board = TERNARY[x_bb] + 2 * TERNARY[o_bb]
+        state = CANON[board]
+        legal = (occ[:, None] & CELL_BITS) == 0
+        q = Q[state[:, None], SYMS[CANON_SYM[board]]]  # rows in this board's frame
+        action = np.where(legal, q, -np.inf).argmax(axis=1)
+        unseen = ~visited[state]
+        action[unseen] = random_legal_moves(occ[unseen])
+        x_bb |= CELL_BITS[action]
+
+        result = WINNER_LUT[x_bb | o_bb << 9]
+        wins += np.count_nonzero(result == X)
+        draws += np.count_nonzero(result == DRAW)
+        alive = result == 0
+        x_bb, o_bb = x_bb[alive], o_bb[alive]
+
+        # Opponent (O)
+        o_bb |= CELL_BITS[opponent(x_bb, o_bb)]
+
+        result = WINNER_LUT[x_bb | o_bb << 9]
+        losses += np.count_nonzero(result == O)
+        draws += np.count_nonzero(result == DRAW)
+        alive = result == 0
+        x_bb, o_bb = x_bb[alive], o_bb[alive]
+
+    return wins, losses, draws
 
 # -------- Test Function --------
 def test_agent(opponent_type: str, n_games: int):
@@ -103,64 +89,21 @@ def test_agent(opponent_type: str, n_games: int):
     # Print progress ~10 times (but not too chatty for small runs)
     step = max(1, n_games // 10)
 
-    for game in range(n_games):
-        board = initialize_board()
-        done = False
-
-        if (game + 1) % step == 0:
-            print(f"  Progress: {game + 1:,}/{n_games:,}")
-
-        while not done:
-            # Agent (X)
-            moves = available_moves(board)
-            if not moves:
-                break
-
-            action = choose_action(get_state(board, "X"), moves)
-            board[action] = "X"
-            winner = check_winner(board)
-
-            if winner == "X":
-                wins += 1
-                done = True
-                break
-            if is_full(board):
-                draws += 1
-                done = True
-                break
-
-            # Opponent (O)
-            opp_moves = available_moves(board)
-            if not opp_moves:
-                break
-
-            if opponent_type == "Smart":
-                opp_action = optimal_move(board)
-                if opp_action is None:
-                    opp_action = random.choice(opp_moves)
-            else:
-                opp_action = random.choice(opp_moves)
-
-            board[opp_action] = "O"
-            winner = check_winner(board)
-
-            if winner == "O":
-                losses += 1
-                done = True
-                break
-            if is_full(board):
-                draws += 1
-                done = True
-                break
+    # Evaluation is greedy, so games are independent: play them in batches
+    for start in range(0, n_games, step):
+        batch = min(step, n_games - start)
+        w, l, d = test_batch(batch, opponent_type)
+        wins, losses, draws = wins + w, losses + l, draws + d
+        print(f"  Progress: {start + batch:,}/{n_games:,}")
 
     return wins, losses, draws, n_games
 
 # -------- Exploration Progress (board-pattern aware) --------
 def exploration_progress():
-    total_legal_boards = 5478
-    total_states = len(Q)
-    # Collapse role-aware keys to board-only patterns
-    unique_boards = len({k[:9] for k in Q.keys()})
+    total_legal_boards = 765  # 5,478 legal boards up to symmetry
+    total_states = q_size(Q)
+    # Collapse the X and O halves of the table to board-only patterns
+    unique_boards = np.count_nonzero(visited.reshape(2, N_STATES).any(axis=0))
     progress = (unique_boards / total_legal_boards) * 100
     print("\nState-space coverage:")
     print(f"  Q entries (role-aware states): {total_states:,}")
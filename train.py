@@ -1,5 +1,15 @@
-import random
-import pickle
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from numba import njit
+
+from ttt_core import (N_STATES, X, O, SYMS, PERM_TABLE, OPTIMAL_POLICY, legal_moves_bb,
+                      check_winner_bb, board_id, get_state, empty_qtable,
+                      load_qtable, save_qtable, q_size)
+
+# The kernels below compile ttt_core's helpers and tables in as constants. Numba's
+# disk cache only tracks changes to this file, so they are not cache=True: a
+# cached copy would keep running stale code after an edit to ttt_core.py.
 
 # -------------------------
 # Parameters
@@ -9,153 +19,160 @@ gamma = 0.9           # discount factor
 epsilon = 0.7         # start high for exploration
 epsilon_min = 0.01
 decay = 0.9997        # decay per episode
+seed = None           # set an int for reproducible runs
+workers = 1           # >1 splits each chunk across that many threads
 
 # -------------------------
 # Load or initialize Q-table
 # -------------------------
 try:
-    with open("qtable.pkl", "rb") as f:
-        Q = pickle.load(f)
-    print(f"✓ Loaded Q-table with {len(Q)} states")
-except:
-    Q = {}
-
-# -------------------------
-# Utility functions
-# -------------------------
-def initialize_board(): return [" "] * 9
-def available_moves(board): return [i for i, v in enumerate(board) if v == " "]
-def check_winner(board):
-    wins = [[0,1,2],[3,4,5],[6,7,8],[0,3,6],[1,4,7],[2,5,8],[0,4,8],[2,4,6]]
-    for a,b,c in wins:
-        if board[a] == board[b] == board[c] != " ": return board[a]
-    if " " not in board: return "D"  # Draw
-    return None
-def get_state(board, role): return "".join(board) + role
-
-# -------------------------
-# Minimax (for Smart opponent)
-# -------------------------
-def minimax(board, is_max, depth=0):
-    winner = check_winner(board)
-    if winner == "O": return 1 - 0.01*depth
-    if winner == "X": return -1 + 0.01*depth
-    if winner == "D": return 0
-    if is_max:
-        best = -999
-        for m in available_moves(board):
-            board[m] = "O"
-            best = max(best, minimax(board, False, depth+1))
-            board[m] = " "
-        return best
-    else:
-        best = 999
-        for m in available_moves(board):
-            board[m] = "X"
-            best = min(best, minimax(board, True, depth+1))
-            board[m] = " "
-        return best
-
-def optimal_move(board):
-    best_score = -999
-    move = None
-    for m in available_moves(board):
-        board[m] = "O"
-        score = minimax(board, False)
-        board[m] = " "
-        if score > best_score:
-            best_score = score
-            move = m
-    return move
+    Q = load_qtable()
+    print(f"✓ Loaded Q-table with {q_size(Q)} states")
+except FileNotFoundError:
+    Q = empty_qtable()
+    print("⚠️ No Q-table found, starting fresh.")
 
 # -------------------------
 # Q-learning functions
 # -------------------------
-def get_q(state, action):
-    return Q.get(state, {}).get(action, 0.0)
-
-def choose_action(state, moves):
-    if random.random() < epsilon:
-        return random.choice(moves)
-    q_vals = [(m, get_q(state, m)) for m in moves]
-    max_q = max(q_vals, key=lambda x:x[1])[1]
-    best = [m for m, q in q_vals if q==max_q]
-    return random.choice(best)
-
-def update_q(state, action, reward, next_state, next_moves):
-    if state not in Q: Q[state] = {}
-    current = Q[state].get(action, 0.0)
-    next_max = max([get_q(next_state, m) for m in next_moves], default=0)
-    Q[state][action] = current + alpha * (reward + gamma * next_max - current)
+@njit
+def choose_action(rng, Q, state, sym, moves, n, epsilon):
+    if rng.random() < epsilon:
+        return moves[int(rng.random() * n)]
+    # Single pass: keep the k-th tied move with probability 1/k (uniform over ties)
+    max_q = -np.inf
+    best = -1
+    n_best = 0
+    for i in range(n):
+        q = Q[state, SYMS[sym, moves[i]]]
+        if q > max_q:
+            max_q, best, n_best = q, moves[i], 1
+        elif q == max_q:
+            n_best += 1
+            if rng.random() * n_best < 1: best = moves[i]
+    return best
+
+@njit
+def update_q(Q, state, action, reward, next_state, next_cols, n_next):
+    # `action` is in the canonical frame of `state`, `next_cols` (legal moves) in that of `next_state`
+    next_max = 0.0
+    if n_next:
+        next_max = -np.inf
+        for i in range(n_next):
+            next_max = max(next_max, Q[next_state, next_cols[i]])
+    Q[state, action] += alpha * (reward + gamma * next_max - Q[state, action])
+
+@njit
+def end_episode(Q, hist_s, hist_a, n_hist, reward):
+    """Terminal update for every move of the episode; there is no next state, so next_max is 0"""
+    for i in range(n_hist):
+        s, a = hist_s[i], hist_a[i]
+        Q[s, a] += alpha * (reward - Q[s, a])
 
 # -------------------------
 # Training loop
 # -------------------------
-modes = [("random", 300_000), ("selfplay", 500_000), ("minimax", 5_000)]
-
-for mode, episodes in modes:
-    print(f"\nTraining mode: {mode.upper()} | Episodes: {episodes}")
-    for ep in range(episodes):
-        board = initialize_board()
-        history = []  # store (state, action, role)
-        done = False
-
-        while not done:
+MODE_IDS = {"random": 0, "selfplay": 1, "minimax": 2}
+
+@njit(nogil=True)
+def train_episodes(rng, Q, OPTIMAL, mode, epsilons):
+    """Play one game per entry of `epsilons` (its exploration rate) in the given mode, updating Q in place"""
+    hist_s = np.empty(9, dtype=np.int64)  # states visited this episode (both roles)
+    hist_a = np.empty(9, dtype=np.int64)  # actions taken from them
+    for ep in range(len(epsilons)):
+        epsilon = epsilons[ep]
+        x_bb, o_bb = 0, 0
+        n_hist = 0
+        # X's state and moves; after the first ply they are carried over from the previous one
+        state_X, sym_X = get_state(x_bb, o_bb, 0)
+        moves, n = legal_moves_bb(x_bb, o_bb)
+
+        while True:
             # X's turn
-            state_X = get_state(board, "X")
-            moves_X = available_moves(board)
-            action_X = choose_action(state_X, moves_X)
-            board[action_X] = "X"
-            history.append((state_X, action_X, "X"))
-
-            winner = check_winner(board)
+            action_X = choose_action(rng, Q, state_X, sym_X, moves, n, epsilon)
+            x_bb |= 1 << action_X
+            canon_X = SYMS[sym_X, action_X]  # the move in state_X's frame
+            hist_s[n_hist] = state_X
+            hist_a[n_hist] = canon_X
+            n_hist += 1
+
+            winner = check_winner_bb(x_bb, o_bb)
             if winner:
-                reward = 10 if winner=="X" else (-10 if winner=="O" else 0)
-                for s,a,r in [(s,a,10 if r=="X" else -10 if r=="O" else 0) for s,a,r in history]:
-                    update_q(s, a, reward, "", [])
-                done = True
+                reward = 10.0 if winner == X else (-10.0 if winner == O else 0.0)
+                end_episode(Q, hist_s, hist_a, n_hist, reward)
                 break
 
             # O's turn
-            state_O = get_state(board, "O")
-            moves_O = available_moves(board)
-            if mode=="random":
-                action_O = random.choice(moves_O)
-            elif mode=="minimax":
-                action_O = optimal_move(board)
-            else:  # selfplay
-                action_O = choose_action(state_O, moves_O)
-
-            board[action_O] = "O"
-            history.append((state_O, action_O, "O"))
-
-            winner = check_winner(board)
+            state_O, sym_O = get_state(x_bb, o_bb, 1)
+            moves, n = legal_moves_bb(x_bb, o_bb)
+            if mode == 0:    # random
+                action_O = moves[int(rng.random() * n)]
+            elif mode == 2:  # minimax
+                action_O = OPTIMAL[board_id(x_bb, o_bb)]
+            else:            # selfplay
+                action_O = choose_action(rng, Q, state_O, sym_O, moves, n, epsilon)
+
+            o_bb |= 1 << action_O
+            canon_O = SYMS[sym_O, action_O]
+            hist_s[n_hist] = state_O
+            hist_a[n_hist] = canon_O
+            n_hist += 1
+
+            winner = check_winner_bb(x_bb, o_bb)
             if winner:
-                reward = 10 if winner=="X" else (-10 if winner=="O" else 0)
-                for s,a,r in [(s,a,10 if r=="X" else -10 if r=="O" else 0) for s,a,r in history]:
-                    update_q(s, a, reward, "", [])
-                done = True
+                reward = 10.0 if winner == X else (-10.0 if winner == O else 0.0)
+                end_episode(Q, hist_s, hist_a, n_hist, reward)
                 break
 
-            # Small intermediate rewards
-            next_state_X = get_state(board, "X")
-            update_q(state_X, action_X, -0.01, next_state_X, available_moves(board))
-            next_state_O = get_state(board, "O")
-            update_q(state_O, action_O, -0.01, next_state_O, available_moves(board))
+            # Small intermediate rewards (X's state and moves for the next ply, reused there)
+            moves, n = legal_moves_bb(x_bb, o_bb)
+            next_X, next_sym = get_state(x_bb, o_bb, 0)
+            # Free cells of the canonical board = legal columns of its row, no per-move SYMS lookup
+            cols, _ = legal_moves_bb(PERM_TABLE[next_sym, x_bb], PERM_TABLE[next_sym, o_bb])
+            update_q(Q, state_X, canon_X, -0.01, next_X, cols, n)
+            update_q(Q, state_O, canon_O, -0.01, next_X + N_STATES, cols, n)
+            state_X, sym_X = next_X, next_sym
+
+def train_parallel(pool, rngs, Q, mode, epsilons):
+    """
+    Split `epsilons` across the workers, each training its own copy of Q
+    (train_episodes releases the GIL, so threads run in parallel). Merge by
+    moving every entry by the average change of the copies that touched it.
+    """
+    n = len(rngs)
+    copies = [Q.copy() for _ in range(n)]
+    parts = np.array_split(epsilons, n)
+    list(pool.map(train_episodes, rngs, copies, [OPTIMAL_POLICY] * n, [mode] * n, parts))
+    delta = np.stack(copies) - Q
+    touched = np.count_nonzero(delta, axis=0)
+    Q += delta.sum(axis=0) / np.maximum(touched, 1)
 
-        # Decay epsilon
-        epsilon
-        if epsilon > epsilon_min: epsilon *= decay
 
-        # Progress
-        if (ep+1) % 5000 == 0:
-            print(f"Ep {ep+1}/{episodes} | Q-size: {len(Q)} | ε={epsilon:.4f}")
+modes = [("random", 300_000), ("selfplay", 500_000), ("minimax", 5_000)]
+# PCG64 generator, passed into the compiled loop (faster there than the legacy np.random state)
+rng = np.random.default_rng(seed)
+if workers > 1:
+    pool = ThreadPoolExecutor(workers)
+    rngs = rng.spawn(workers)  # independent stream per worker
+
+for mode, episodes in modes:
+    print(f"\nTraining mode: {mode.upper()} | Episodes: {episodes}")
+    # ε for every episode of this mode: decayed once per episode, floored at epsilon_min
+    epsilons = np.maximum(epsilon_min, epsilon * decay ** np.arange(episodes))
+    # Run the compiled loop in chunks so we can still report progress
+    for ep in range(0, episodes, 5000):
+        chunk = epsilons[ep:ep+5000]
+        if workers > 1:
+            train_parallel(pool, rngs, Q, MODE_IDS[mode], chunk)
+        else:
+            train_episodes(rng, Q, OPTIMAL_POLICY, MODE_IDS[mode], chunk)
+        epsilon = max(epsilon_min, chunk[-1] * decay)
+        print(f"Ep {ep+len(chunk)}/{episodes} | Q-size: {q_size(Q)} | ε={epsilon:.4f}")
 
 # -------------------------
 # Save Q-table
 # -------------------------
-with open("qtable.pkl", "wb") as f:
-    pickle.dump(Q, f)
+save_qtable(Q)
 
 print("\nTRAINING COMPLETE")
-print(f"Q-table size: {len(Q)} | Final ε={epsilon:.4f}")
+print(f"Q-table size: {q_size(Q)} | Final ε={epsilon:.4f}")
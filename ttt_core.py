@@ -0,0 +1,224 @@
+"""
+Shared tic-tac-toe logic for gui.py, test.py and train.py.
+
+Boards are a pair of 9-bit bitboards (x_bb, o_bb); bit i set = cell i taken.
+The hot helpers are compiled once with Numba; cache=True keeps the machine
+code on disk so the GUI, evaluation and training runs all reuse it (except
+the recursive minimax, which Numba can't load back from its cache).
+"""
+import os
+import pickle
+import numpy as np
+from numba import njit
+
+N_STATES = 3 ** 9     # ternary board encodings; Q has one block per role
+
+# Winner codes (0 = game still running)
+X, O, DRAW = 1, 2, 3
+
+# -------- Lookup tables --------
+WIN_MASKS = (0b000000111, 0b000111000, 0b111000000,
+             0b001001001, 0b010010010, 0b100100100,
+             0b100010001, 0b001010100)
+# WIN_LOOKUP[bb] is True if bitboard bb contains a winning line
+WIN_LOOKUP = np.array([any((bb & m) == m for m in WIN_MASKS) for bb in range(512)])
+
+# WINNER_LUT[x_bb | o_bb << 9] is the winner code of that position
+_x, _o = np.arange(1 << 18) & 0x1FF, np.arange(1 << 18) >> 9
+WINNER_LUT = np.select([WIN_LOOKUP[_x], WIN_LOOKUP[_o], (_x | _o) == 0x1FF],
+                       [X, O, DRAW], 0).astype(np.int8)
+del _x, _o  # 4 MB of build-only scratch
+
+STATE_POWERS = 3 ** np.arange(9)
+BITS = (np.arange(512)[:, None] >> np.arange(9)) & 1  # [bb, i] = bit i of bb
+CELL_BITS = 1 << np.arange(9)
+# TERNARY[bb] = sum of 3**i over the set bits of bb, so X=1/O=2 per cell is TERNARY[x_bb] + 2*TERNARY[o_bb]
+TERNARY = BITS @ STATE_POWERS
+
+# D4 symmetry (4 rotations x reflection): SYMS[k, i] is where cell i lands under symmetry k
+def _sym_cell(k, i):
+    r, c = divmod(i, 3)
+    for _ in range(k % 4):
+        r, c = c, 2 - r
+    if k >= 4:
+        c = 2 - c
+    return 3 * r + c
+
+SYMS = np.array([[_sym_cell(k, i) for i in range(9)] for k in range(8)])
+PERM_TABLE = (BITS << SYMS[:, None, :]).sum(axis=2)  # [k, bb] -> image of bb under symmetry k
+# For each board id: the smallest id among its 8 images (CANON) and the symmetry reaching it (CANON_SYM)
+_cells = np.arange(N_STATES)[:, None] // STATE_POWERS % 3
+_images = (TERNARY[PERM_TABLE[:, (_cells == 1) @ CELL_BITS]]
+           + 2 * TERNARY[PERM_TABLE[:, (_cells == 2) @ CELL_BITS]])
+CANON, CANON_SYM = _images.min(axis=0), _images.argmin(axis=0)
+del _cells, _images
+
+# LEGAL_MOVES[occ, :N_LEGAL[occ]] = free cells of occupancy mask occ (rest padded with -1)
+LEGAL_MOVES = np.array([[i for i in range(9) if not (occ >> i) & 1] + [-1] * bin(occ).count("1")
+                        for occ in range(512)], dtype=np.int64)
+N_LEGAL = (LEGAL_MOVES >= 0).sum(axis=1)
+# Same free cells as tuples, for plain-Python callers (random.choice, iteration)
+LEGAL_MOVES_TABLE = [tuple(row[:n]) for row, n in zip(LEGAL_MOVES.tolist(), N_LEGAL.tolist())]
+
+# -------- Board helpers --------
+@njit(cache=True)
+def legal_moves_bb(x_bb, o_bb):
+    """Free cells (a row of LEGAL_MOVES) and how many there are"""
+    occ = x_bb | o_bb
+    return LEGAL_MOVES[occ], N_LEGAL[occ]
+
+@njit(cache=True)
+def check_winner_bb(x_bb, o_bb):
+    return WINNER_LUT[x_bb | (o_bb << 9)]
+
+@njit(cache=True)
+def board_id(x_bb, o_bb):
+    return TERNARY[x_bb] + 2 * TERNARY[o_bb]
+
+# State: Q row of the board's canonical form, offset by N_STATES for role O (X=0, O=1),
+# and the symmetry k mapping the board onto it (move m is column SYMS[k, m] of that row)
+@njit(cache=True)
+def get_state(x_bb, o_bb, role):
+    b = board_id(x_bb, o_bb)
+    return CANON[b] + N_STATES * role, CANON_SYM[b]
+
+# -------- Persistence --------
+def _atomic_write(path, write_fn):
+    """
+    Call write_fn(f) on a temp file next to `path`, then os.replace it
+    into place, so an interrupted save never leaves a truncated file.
+    """
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        write_fn(f)
+    os.replace(tmp, path)
+
+def _dump(obj, path):
+    # Protocol 5 writes an array's buffer in one piece instead of walking Python objects
+    _atomic_write(path, lambda f: pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL))
+
+# -------- Minimax (Smart opponent) --------
+# Transposition table indexed by canonical board id + N_STATES if O to move, NaN = not
+# searched yet. A score doesn't change under symmetry, so all 8 images share one entry.
+# With pruning a stored score can be a bound; TT_FLAG says which kind it is.
+TT = np.full(2 * N_STATES, np.nan)
+EXACT, LOWER, UPPER = 0, 1, 2
+TT_FLAG = np.zeros(2 * N_STATES, dtype=np.int8)
+
+@njit(cache=True)
+def _undecay(bound):
+    # Bound on a node's score -> bound on the best child score before the 0.01 pull
+    return bound + 0.01 if bound > 0 else (bound - 0.01 if bound < 0 else 0.0)
+
+# Not cache=True: Numba segfaults loading recursive functions (or anything
+# that compiles one in, like search_optimal_move) back from its disk cache
+@njit
+def minimax_bb(TT, TT_FLAG, x_bb, o_bb, is_max, alpha=-999.0, beta=999.0):
+    # Scores are relative to this node (win now = 1, one ply later = 0.99, ...)
+    # so a cached score is valid however deep the position is reached
+    key = CANON[board_id(x_bb, o_bb)] + (N_STATES if is_max else 0)
+    if not np.isnan(TT[key]):
+        flag = TT_FLAG[key]
+        if (flag == EXACT or (flag == LOWER and TT[key] >= beta)
+                or (flag == UPPER and TT[key] <= alpha)):
+            return TT[key]
+    winner = check_winner_bb(x_bb, o_bb)
+    if winner == O: score = 1.0
+    elif winner == X: score = -1.0
+    elif winner == DRAW: score = 0.0
+    else:
+        # Alpha-beta on the children's scores, which the 0.01 pull maps onto ours
+        lo, hi = _undecay(alpha), _undecay(beta)
+        moves, n = legal_moves_bb(x_bb, o_bb)
+        if is_max:
+            best = -999.0
+            for i in range(n):
+                best = max(best, minimax_bb(TT, TT_FLAG, x_bb, o_bb | (1 << moves[i]), False, lo, hi))
+                lo = max(lo, best)
+                if hi <= lo: break
+        else:
+            best = 999.0
+            for i in range(n):
+                best = min(best, minimax_bb(TT, TT_FLAG, x_bb | (1 << moves[i]), o_bb, True, lo, hi))
+                hi = min(hi, best)
+                if hi <= lo: break
+        # One ply further from the result: prefer quick wins, slow losses
+        score = best - 0.01 if best > 0 else (best + 0.01 if best < 0 else 0.0)
+    TT[key] = score
+    TT_FLAG[key] = UPPER if score <= alpha else (LOWER if score >= beta else EXACT)
+    return score
+
+@njit
+def search_optimal_move(TT, TT_FLAG, x_bb, o_bb):
+    best_score = -999.0
+    move = -1
+    moves, n = legal_moves_bb(x_bb, o_bb)
+    for i in range(n):
+        # Only a strictly better move matters, so the best so far is the lower bound
+        score = minimax_bb(TT, TT_FLAG, x_bb, o_bb | (1 << moves[i]), False, best_score, 999.0)
+        if score > best_score:
+            best_score = score
+            move = moves[i]
+    return move
+
+def build_optimal_policy():
+    """
+    Best O move for every reachable position with O to move, indexed by
+    board id (-1 where O is not to move).
+    """
+    policy = np.full(N_STATES, -1, dtype=np.int8)
+    # Positions are packed as x_bb | o_bb << 9 so the stack and seen set hold plain ints
+    seen = set()
+    stack = [0]
+    while stack:
+        b = stack.pop()
+        if b in seen:
+            continue
+        seen.add(b)
+        x_bb, o_bb = b & 0x1FF, b >> 9
+        if check_winner_bb(x_bb, o_bb):
+            continue
+        free = LEGAL_MOVES_TABLE[x_bb | o_bb]
+        o_to_move = len(free) % 2 == 0  # X has moved once more than O
+        if o_to_move:
+            policy[board_id(x_bb, o_bb)] = search_optimal_move(TT, TT_FLAG, x_bb, o_bb)
+        for m in free:
+            stack.append(b | (1 << (m + 9) if o_to_move else 1 << m))
+    return policy
+
+def load_optimal_policy(path="optimal.pkl"):
+    """Policy table from `path`, searched and saved there on first use (or if the file is unusable)"""
+    try:
+        with open(path, "rb") as f:
+            policy = pickle.load(f)
+        if (isinstance(policy, np.ndarray) and policy.shape == (N_STATES,)
+                and policy.dtype == np.int8):
+            return policy
+    except (OSError, pickle.UnpicklingError, EOFError):
+        pass
+    policy = build_optimal_policy()
+    _dump(policy, path)
+    return policy
+
+OPTIMAL_POLICY = load_optimal_policy()
+
+# -------- Q-table --------
+# Dense float32 array Q[state, action], state from get_state. Rows use the ternary
+# board id rather than the packed x_bb | o_bb << 9, which keeps the table at
+# 2 * 3**9 rows (1.4 MB) instead of 2**18 (9.4 MB); an all-zero row = never visited.
+def empty_qtable():
+    return np.zeros((2 * N_STATES, 9), dtype=np.float32)
+
+def load_qtable(path="qtable.npy", mmap_mode=None):
+    """Q-table from `path`; mmap_mode="r" maps the file read-only instead of copying it in"""
+    Q = np.load(path, mmap_mode=mmap_mode)
+    if Q.shape != (2 * N_STATES, 9) or Q.dtype != np.float32:
+        raise ValueError(f"{path} is not a dense Q-table; retrain with train.py")
+    return Q
+
+def save_qtable(Q, path="qtable.npy"):
+    _atomic_write(path, lambda f: np.save(f, Q))
+
+def q_size(Q):
+    """Number of states the agent has learned anything about"""
+    return int(np.count_nonzero(Q.any(axis=1)))